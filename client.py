@@ -5,9 +5,12 @@ import argparse
 import random
 import socket
 import sys
+import threading
 import time
 from typing import List
 
+from linereader import LineReader
+
 
 # Random words for generating jobs
 RANDOM_WORDS = [
@@ -29,39 +32,78 @@ RANDOM_WORDS = [
 ]
 
 
-def generate_random_job() -> str:
-    """Generate a random job with 1-5 random words."""
-    num_words = random.randint(1, 5)
-    words = random.sample(RANDOM_WORDS, num_words)
-    return " ".join(words)
+# Pre-encoded words so job payloads can be assembled without re-encoding
+RANDOM_WORDS_B = [word.encode() for word in RANDOM_WORDS]
+
+
+def generate_random_jobs(num_jobs: int) -> List[List[int]]:
+    """Generate jobs up front, each the indices of 1-5 distinct random words."""
+    word_range = range(len(RANDOM_WORDS))
+    sample = random.sample
+    return [sample(word_range, num_words)
+            for num_words in random.choices(range(1, 6), k=num_jobs)]
+
+
+def job_payload(word_idxs: List[int]) -> bytes:
+    """Build the JOB line for a generated job."""
+    return b"JOB " + b" ".join(RANDOM_WORDS_B[i] for i in word_idxs) + b"\n"
+
+
+def job_text(word_idxs: List[int]) -> str:
+    """Human-readable text of a generated job."""
+    return " ".join(RANDOM_WORDS[i] for i in word_idxs)
+
+
+def _send_jobs(sock: socket.socket, payloads: List[bytes], delay: float) -> None:
+    """Submit job payloads over an open connection, sleeping `delay` between sends."""
+    try:
+        if delay <= 0:
+            # The protocol is line-oriented, so all jobs can be pipelined in
+            # a single write and the IDs read back in order.
+            sock.sendall(b"".join(payloads))
+            return
+        for i, payload in enumerate(payloads):
+            if i:
+                time.sleep(delay)
+            sock.sendall(payload)
+    except OSError:
+        # The reading side notices the broken connection and reports it.
+        pass
 
 
 def auto_call(host: str, port: int, num_jobs: int = 5, delay: float = 0.1) -> int:
-    """Send multiple random jobs to the work queue."""
+    """Send multiple random jobs to the work queue over a single connection."""
     print(f"Sending {num_jobs} random jobs to {host}:{port}")
     print(f"Delay between jobs: {delay}s")
     print("-" * 50)
     
+    jobs = generate_random_jobs(num_jobs)
+    payloads = [job_payload(job) for job in jobs]
     job_ids = []
+    i = 0
+    
+    try:
+        with socket.create_connection((host, port)) as sock:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            # Send from a background thread so responses are read as soon as
+            # they arrive instead of piling up behind the submissions.
+            threading.Thread(target=_send_jobs, args=(sock, payloads, delay),
+                             daemon=True).start()
+            
+            reader = LineReader(sock)
+            for i, job in enumerate(jobs):
+                response = reader.read_line()
+                if response is None:
+                    raise ConnectionError("connection closed by work queue")
+                response = response.strip()
+                job_ids.append(response)
+                print(f"Job {i+1:2d}: {job_text(job):<30} -> {response}")
     
-    for i in range(num_jobs):
-        job_text = generate_random_job()
-        message = f"JOB {job_text}"
-        
-        try:
-            with socket.create_connection((host, port)) as sock:
-                sock.sendall((message + "\n").encode())
-                response = recv_line(sock)
-                job_ids.append(response.strip())
-                print(f"Job {i+1:2d}: {job_text:<30} -> {response.strip()}")
-                
-                # Small delay to avoid overwhelming the server
-                if delay > 0:
-                    time.sleep(delay)
-                    
-        except Exception as e:
-            print(f"Job {i+1:2d}: {job_text:<30} -> ERROR: {e}")
-            continue
+    except Exception as e:
+        if jobs:
+            print(f"Job {i+1:2d}: {job_text(jobs[i]):<30} -> ERROR: {e}")
+        else:
+            print(f"ERROR: {e}")
     
     print("-" * 10)
     print(f"Successfully submitted {len(job_ids)} jobs")
@@ -89,18 +131,6 @@ def build_message(command: str, params: List[str]) -> str:
     raise SystemExit("Unsupported command")
 
 
-def recv_line(sock: socket.socket) -> str:
-    data = bytearray()
-    while True:
-        chunk = sock.recv(1)
-        if not chunk:
-            break
-        if chunk == b"\n":
-            break
-        data.extend(chunk)
-    return data.decode(errors="ignore")
-
-
 def main(argv: List[str]) -> int:
     parser = argparse.ArgumentParser(description="Submit jobs or request status from the queue")
     parser.add_argument("host", help="work queue host")
@@ -122,8 +152,11 @@ def main(argv: List[str]) -> int:
     message = build_message(args.command, args.params)
 
     with socket.create_connection((args.host, args.port)) as sock:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         sock.sendall((message + "\n").encode())
-        response = recv_line(sock)
+        response = LineReader(sock).read_line()
+    if response is None:
+        raise SystemExit("connection closed by work queue")
     print(response)
     return 0
 
@@ -0,0 +1,34 @@
+"""Buffered line reading for the newline-delimited TCP protocol.
+
+Shared by the client and the worker.
+"""
+
+import socket
+from typing import Optional
+
+
+class LineReader:
+    """Buffered reader that splits a TCP stream into newline-delimited lines.
+
+    One reader is kept per connection so bytes received past the end of a
+    line are retained for the next call instead of being read one at a time.
+    """
+
+    def __init__(self, sock: socket.socket) -> None:
+        self.sock = sock
+        self.buf = bytearray()
+
+    def read_line(self) -> Optional[str]:
+        """Read a single newline-delimited line; return None on disconnect."""
+        try:
+            while b"\n" not in self.buf:
+                chunk = self.sock.recv(4096)
+                if not chunk:
+                    return None
+                self.buf += chunk
+        except OSError:
+            return None
+        i = self.buf.index(b"\n")
+        line = self.buf[:i].decode(errors="ignore")
+        del self.buf[:i + 1]
+        return line
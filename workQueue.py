@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
-import socket, select, sys
+import errno, os, socket, selectors, sys
 from collections import deque
+from itertools import islice
 
 # Usage: python3 workqueue.py <client_port> <worker_port>
 CLIENT_PORT = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
@@ -9,155 +10,247 @@ WORKER_PORT = int(sys.argv[2]) if len(sys.argv) > 2 else 50001
 print(f"work queue listening on client port {CLIENT_PORT} and worker port {WORKER_PORT}")
 
 # ---- State ----
-next_id = 1
-jobs = {}          # id -> {"text": str, "state": "waiting|running|completed"}
+# Job ids are dense integers starting at 1, so job data is kept in parallel
+# arrays indexed by id (index 0 is a placeholder).
+WAITING, RUNNING, COMPLETED = 0, 1, 2
+STATE_NAMES = (b"waiting", b"running", b"completed")
+
+job_text = [b""]                 # id -> job text (raw bytes, never decoded)
+job_state = bytearray([WAITING]) # id -> WAITING | RUNNING | COMPLETED
 waiting = deque()  # job ids waiting to assign
-running = set()    # job ids currently assigned
-worker_job = {}    # worker socket -> currently assigned job id (or None)
 
-# Per-connection buffers
-recv_buf = {}      # sock -> pending bytes
-is_worker = {}     # sock -> bool (True = worker, False = client)
+recv_view = memoryview(bytearray(4096))  # scratch space reused by every recv_into
+# Most buffers handed to a single sendmsg call (or joined for a plain send)
+try:
+    IOV_MAX = os.sysconf("SC_IOV_MAX")
+except (AttributeError, ValueError, OSError):  # no sysconf, or name unknown
+    IOV_MAX = -1
+if IOV_MAX <= 0:
+    IOV_MAX = 1024
+HAVE_SENDMSG = hasattr(socket.socket, "sendmsg")
+OUT_HIGH_WATER = 256 * 1024  # stop reading from a peer with this much unsent reply data
+
+class Conn:
+    """Per-connection state, stored as the connection's selector data."""
+    __slots__ = ("sock", "is_worker", "buf", "scan", "out", "out_bytes", "events", "job")
+
+    def __init__(self, sock, is_worker):
+        self.sock = sock
+        self.is_worker = is_worker
+        self.buf = bytearray()  # pending (partial line) bytes
+        self.scan = 0           # bytes of buf already searched for a newline
+        self.out = deque()      # queued outgoing lines, flushed together
+        self.out_bytes = 0      # total size of the lines in out
+        self.events = selectors.EVENT_READ  # events currently registered
+        self.job = None         # job id currently assigned to a worker
 
 def make_listener(port):
     s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     s.bind(("0.0.0.0", port))
-    s.listen(64)
+    s.listen(socket.SOMAXCONN)  # absorb connection bursts; accept_all drains them
     s.setblocking(False)
     return s
 
 client_ls = make_listener(CLIENT_PORT)
 worker_ls = make_listener(WORKER_PORT)
 
-# All sockets we watch
-inputs = { client_ls, worker_ls }
-outputs = set()
-
-def close_sock(s):
-    recv_buf.pop(s, None)
-    is_worker.pop(s, None)
-    if s in worker_job:
-        jid = worker_job.pop(s)
-        if jid is not None and jid in jobs and jobs[jid]["state"] == "running":
-            # Requeue unfinished work so it is not lost when a worker disconnects.
-            running.discard(jid)
-            jobs[jid]["state"] = "waiting"
-            waiting.appendleft(jid)
+# All sockets we watch; listeners have no data, connections carry their Conn.
+sel = selectors.DefaultSelector()
+sel.register(client_ls, selectors.EVENT_READ)
+sel.register(worker_ls, selectors.EVENT_READ)
+
+# Listeners taken out of the selector because accept() ran out of descriptors;
+# they are watched again once a connection closes and frees one up.
+paused_listeners = []
+
+def close_sock(c):
+    jid = c.job
+    if jid is not None and job_state[jid] == RUNNING:
+        # Requeue unfinished work so it is not lost when a worker disconnects.
+        job_state[jid] = WAITING
+        waiting.appendleft(jid)
+    c.job = None
+    c.out.clear()
+    c.out_bytes = 0
+    try:
+        sel.unregister(c.sock)
+    except (KeyError, ValueError): pass
     try:
-        inputs.discard(s); outputs.discard(s)
-        s.close()
+        c.sock.close()
     except: pass
+    while paused_listeners:
+        sel.register(paused_listeners.pop(), selectors.EVENT_READ)
 
-def send_line(s, line: str):
+def send_line(c, line: bytes):
+    """Queue a line for the connection; it is written out by flush()."""
+    line += b"\n"
+    c.out.append(line)
+    c.out_bytes += len(line)
+
+def flush(c):
+    """Write queued lines with as few syscalls as possible.
+
+    Everything queued while handling one read goes out in a single sendmsg.
+    If the socket buffer fills up, the rest waits for EVENT_WRITE, and once
+    more than OUT_HIGH_WATER bytes are queued the connection is not read from
+    until its peer catches up.
+    """
+    if c.sock.fileno() < 0:
+        return  # closed while handling its lines
+    out = c.out
     try:
-        s.sendall((line + "\n").encode())
+        while out:
+            if HAVE_SENDMSG:
+                sent = c.sock.sendmsg(list(islice(out, IOV_MAX)))
+            else:
+                sent = c.sock.send(b"".join(islice(out, IOV_MAX)))
+            c.out_bytes -= sent
+            while sent:
+                head = out[0]
+                if len(head) <= sent:
+                    sent -= len(head)
+                    out.popleft()
+                else:
+                    out[0] = head[sent:]
+                    sent = 0
+    except BlockingIOError:
+        pass
     except:
-        close_sock(s)
-
-def handle_client_line(s, line: str):
-    line = line.strip()
-    if not line: return
-    parts = line.split(maxsplit=1)
-    cmd = parts[0].upper()
-
-    if cmd == "JOB" and len(parts) == 2:
-        global next_id
-        text = parts[1]
-        jid = next_id; next_id += 1
-        jobs[jid] = {"text": text, "state": "waiting"}
+        close_sock(c)
+        return
+
+    events = ((selectors.EVENT_READ if c.out_bytes <= OUT_HIGH_WATER else 0)
+              | (selectors.EVENT_WRITE if out else 0))
+    if events != c.events:
+        c.events = events
+        sel.modify(c.sock, events, data=c)
+
+def parse_cmd(line: bytes):
+    """Split a line into its upper-cased command and the rest of the line.
+
+    The command ends at the first ASCII whitespace, as with bytes.split().
+    """
+    parts = line.split(None, 1)
+    if not parts:
+        return b"", b""
+    return parts[0].upper(), parts[1].rstrip() if len(parts) == 2 else b""
+
+def handle_client_line(c, line: bytes):
+    cmd, rest = parse_cmd(line)
+    if not cmd: return
+
+    if cmd == b"JOB" and rest:
+        job_text.append(rest)
+        job_state.append(WAITING)
+        jid = len(job_text) - 1
         waiting.append(jid)
-        send_line(s, f"ID {jid}")
-    elif cmd == "STATUS" and len(parts) == 2:
+        send_line(c, b"ID %d" % jid)
+    elif cmd == b"STATUS" and rest:
         try:
-            jid = int(parts[1])
-            st = jobs.get(jid, {}).get("state", "unknown")
-            send_line(s, st)
+            jid = int(rest)
+            if 0 < jid < len(job_text):
+                send_line(c, STATE_NAMES[job_state[jid]])
+            else:
+                send_line(c, b"unknown")
         except:
-            send_line(s, "unknown")
+            send_line(c, b"unknown")
     else:
-        send_line(s, "ERR")
-
-def handle_worker_line(s, line: str):
-    line = line.strip()
-    if not line: return
-    parts = line.split(maxsplit=2)
-    cmd = parts[0].upper()
-
-    if cmd == "FETCH":
-        current = worker_job.get(s)
-        if current is not None and current in jobs and jobs[current]["state"] == "running":
-            text = jobs[current]["text"]
-            send_line(s, f"JOB {current} {text}")
+        send_line(c, b"ERR")
+
+def handle_worker_line(c, line: bytes):
+    cmd, rest = parse_cmd(line)
+    if not cmd: return
+
+    if cmd == b"FETCH":
+        current = c.job
+        if current is not None and job_state[current] == RUNNING:
+            send_line(c, b"JOB %d %b" % (current, job_text[current]))
         elif waiting:
             jid = waiting.popleft()
-            running.add(jid)
-            jobs[jid]["state"] = "running"
-            text = jobs[jid]["text"]
-            worker_job[s] = jid
-            send_line(s, f"JOB {jid} {text}")
+            job_state[jid] = RUNNING
+            c.job = jid
+            send_line(c, b"JOB %d %b" % (jid, job_text[jid]))
         else:
-            send_line(s, "NOJOB")
+            send_line(c, b"NOJOB")
 
-    elif cmd == "DONE" and len(parts) >= 2:
+    elif cmd == b"DONE" and rest:
         try:
-            jid = int(parts[1])
-            if jid in running:
-                running.remove(jid)
-            if jid in jobs:
-                jobs[jid]["state"] = "completed"
-                if worker_job.get(s) == jid:
-                    worker_job[s] = None
-                send_line(s, "OK")
+            jid = int(rest.split(None, 1)[0])  # ignore any trailing tokens
+            if 0 < jid < len(job_text):
+                job_state[jid] = COMPLETED
+                if c.job == jid:
+                    c.job = None
+                send_line(c, b"OK")
             else:
-                send_line(s, "ERR")
+                send_line(c, b"ERR")
         except:
-            send_line(s, "ERR")
+            send_line(c, b"ERR")
     else:
-        send_line(s, "ERR")
+        send_line(c, b"ERR")
+
+def accept_all(listener, is_worker):
+    """Accept every pending connection on a listener, not just one per event."""
+    while True:
+        try:
+            conn, _ = listener.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            if e.errno in (errno.EMFILE, errno.ENFILE):
+                # The connection stays in the backlog, so the listener would
+                # stay readable and spin the loop; stop watching it until a
+                # descriptor is freed.
+                sel.unregister(listener)
+                paused_listeners.append(listener)
+            # Anything else (e.g. the peer reset before accept) drops just
+            # that connection from the backlog.
+            return
+        conn.setblocking(False)
+        # Replies are tiny; don't let Nagle hold them back.
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sel.register(conn, selectors.EVENT_READ, data=Conn(conn, is_worker))
 
-def read_lines(s):
-    """Read available bytes; return list of full lines (without trailing \\n)."""
+def read_lines(c):
+    """Read available bytes; yield full lines (without trailing \\n)."""
     try:
-        data = s.recv(4096)
+        n = c.sock.recv_into(recv_view)
     except BlockingIOError:
-        return []
+        return
     except:
-        close_sock(s)
-        return []
+        close_sock(c)
+        return
 
-    if not data:
-        close_sock(s)
-        return []
+    if not n:
+        close_sock(c)
+        return
 
-    buf = recv_buf.get(s, b"") + data
-    lines = buf.split(b"\n")
-    recv_buf[s] = lines[-1]  # keep partial
-    return [ln.decode(errors="ignore") for ln in lines[:-1]]
+    # Only the newly received bytes need scanning for newlines; complete lines
+    # are sliced out by offset and dropped from the buffer in one go.
+    buf = c.buf
+    buf += recv_view[:n]
+    start, pos = c.scan, 0
+    while (i := buf.find(b"\n", start)) != -1:
+        line = bytes(buf[pos:i])
+        pos = start = i + 1
+        yield line
+    del buf[:pos]  # keep partial
+    c.scan = len(buf)
 
 while True:
-    r, w, x = select.select(list(inputs), list(outputs), list(inputs), 1.0)
-
-    for s in r:
-        if s is client_ls or s is worker_ls:
-            # Accept new connection
-            conn, _ = s.accept()
-            conn.setblocking(False)
-            inputs.add(conn)
-            recv_buf[conn] = b""
-            is_worker[conn] = (s is worker_ls)
-            if is_worker[conn]:
-                worker_job[conn] = None
+    # Nothing is timer-driven, so block until a socket is ready.
+    for key, mask in sel.select():
+        c = key.data
+        if c is None:
+            # Accept new connections
+            accept_all(key.fileobj, key.fileobj is worker_ls)
         else:
-            # Existing connection: read & handle complete lines
-            lines = read_lines(s)
-            for line in lines:
-                if is_worker.get(s, False):
-                    handle_worker_line(s, line)
-                else:
-                    handle_client_line(s, line)
-
-    # Exceptional conditions -> close
-    for s in x:
-        if s in (client_ls, worker_ls): continue
-        close_sock(s)
+            # Existing connection: read & handle complete lines, then send
+            # all of the replies together
+            if mask & selectors.EVENT_READ:
+                for line in read_lines(c):
+                    if c.is_worker:
+                        handle_worker_line(c, line)
+                    else:
+                        handle_client_line(c, line)
+            flush(c)
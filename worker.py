@@ -2,14 +2,15 @@
 """Simple TCP worker for the messaging queue assignment."""
 
 import argparse
+import functools
 import signal
 import socket
 import sys
 import time
-from typing import Optional
 
 # Import the multicast library
 import multicast
+from linereader import LineReader
 
 FETCH_INTERVAL = 0.5  # seconds to wait before asking for more work when idle
 WORD_DELAY = 0.25     # seconds to sleep between each word of the job text
@@ -25,21 +26,6 @@ def _signal_handler(_sig, _frame) -> None:
     stop_requested = True
 
 
-def recv_line(sock: socket.socket) -> Optional[str]:
-    """Read a single newline-delimited line; return None on disconnect."""
-    data = bytearray()
-    try:
-        while True:
-            chunk = sock.recv(1)
-            if not chunk:
-                return None
-            if chunk == b"\n":
-                return data.decode(errors="ignore")
-            data.extend(chunk)
-    except OSError:
-        return None
-
-
 def send_line(sock: socket.socket, line: str) -> bool:
     try:
         sock.sendall((line + "\n").encode())
@@ -48,46 +34,55 @@ def send_line(sock: socket.socket, line: str) -> bool:
         return False
 
 
-def send_to_syslog(message: str, syslog_port: int) -> None:
+SYSLOG_PREFIX = b"<14>worker: "
+
+
+def send_to_syslog(sock: socket.socket, message: str, addr: tuple[str, int]) -> None:
     """Send a message to syslog via UDP (broadcast, not multicast)."""
     try:
-        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-            syslog_msg = f"<14>worker: {message}\n"
-            # Send as regular UDP unicast to localhost
-            sock.sendto(syslog_msg.encode(), ("127.0.0.1", syslog_port))
+        # Send as regular UDP unicast to localhost
+        sock.sendto(SYSLOG_PREFIX + message.encode() + b"\n", addr)
     except OSError:
         pass
 
 
-def process_job(mcast_sock: socket.socket, tcp_sock: socket.socket, job_id: int,
-                text: str, output_port: int, syslog_port: int) -> bool:
-    """Process a job by sending each word via multicast."""
-    send_to_syslog(f"running job {job_id}", syslog_port)
+@functools.lru_cache(maxsize=1024)
+def _encode_word(word: str) -> bytes:
+    """Newline-terminated encoding of a word; job vocabularies repeat a lot."""
+    return word.encode() + b"\n"
+
+
+def process_job(mcast_sock: socket.socket, tcp_sock: socket.socket, reader: LineReader,
+                job_id: int, text: str, mcast_dest: tuple[str, int],
+                syslog_sock: socket.socket, syslog_addr: tuple[str, int]) -> bool:
+    """Process a job by sending each word via multicast, then report it.
+
+    On success the next FETCH has already been sent, so the caller only needs
+    to read its response.
+    """
+    send_to_syslog(syslog_sock, f"running job {job_id}", syslog_addr)
     
     for word in text.split():
         # Send word via multicast using the library's socket
-        payload = f"{word}\n".encode()
-        mcast_sock.sendto(payload, (MULTICAST_GROUP, output_port))
+        mcast_sock.sendto(_encode_word(word), mcast_dest)
         time.sleep(WORD_DELAY)
         if stop_requested:
-            break
-    
-    if stop_requested:
-        return False
+            return False
     
-    send_to_syslog(f"completed job {job_id}", syslog_port)
+    send_to_syslog(syslog_sock, f"completed job {job_id}", syslog_addr)
 
-    if not send_line(tcp_sock, f"DONE {job_id}"):
+    # Report completion and ask for the next job in a single write, saving a
+    # round trip per job. The queue answers the two lines in order.
+    if not send_line(tcp_sock, f"DONE {job_id}\nFETCH"):
         return False
 
-    # Drain the acknowledgement from the queue so it does not get mistaken for
-    # the response to the next FETCH request. When this ACK is left unread the
-    # worker will immediately issue another FETCH, the queue will interpret
-    # that as a retry for the in-flight job, and the same job text will be
-    # delivered again. That behaviour was causing duplicated job processing.
-    ack = recv_line(tcp_sock)
+    # The queue answers DONE before the FETCH sent with it, so the ACK must be
+    # read first; otherwise it would be mistaken for the response to that
+    # FETCH, and the real JOB/NOJOB reply would be read in place of a later
+    # response, putting every following exchange one line out of step.
+    ack = reader.read_line()
     if ack != "OK":
-        send_to_syslog(f"unexpected ACK '{ack}' for job {job_id}", syslog_port)
+        send_to_syslog(syslog_sock, f"unexpected ACK '{ack}' for job {job_id}", syslog_addr)
         return False
 
     return True
@@ -99,43 +94,55 @@ def run_worker(host: str, port: int, output_port: int, syslog_port: int) -> None
     
     # Create multicast sender socket using the library
     mcast_sock = multicast.multicastSenderSocket()
+    syslog_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    syslog_addr = ("127.0.0.1", syslog_port)
+    mcast_dest = (MULTICAST_GROUP, output_port)
     
-    while not stop_requested:
-        try:
-            with socket.create_connection((host, port), timeout=10) as tcp_sock:
-                tcp_sock.settimeout(None)
-                send_to_syslog("worker started", syslog_port)
-
-                while not stop_requested:
-                    if not send_line(tcp_sock, "FETCH"):
-                        break
-                    response = recv_line(tcp_sock)
-                    if response is None:
-                        break
-                    if response.startswith("JOB "):
-                        parts = response.split(maxsplit=2)
-                        if len(parts) < 3:
-                            continue
-                        try:
-                            job_id = int(parts[1])
-                        except ValueError:
-                            continue
-                        text = parts[2]
-                        send_to_syslog(f"fetching job {job_id}", syslog_port)
-                        if not process_job(mcast_sock, tcp_sock, job_id, text,
-                                         output_port, syslog_port):
+    try:
+        while not stop_requested:
+            try:
+                with socket.create_connection((host, port), timeout=10) as tcp_sock:
+                    tcp_sock.settimeout(None)
+                    # FETCH/DONE are tiny request/response messages: disable Nagle.
+                    tcp_sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                    reader = LineReader(tcp_sock)
+                    send_to_syslog(syslog_sock, "worker started", syslog_addr)
+
+                    fetch_sent = False
+                    while not stop_requested:
+                        if not fetch_sent and not send_line(tcp_sock, "FETCH"):
                             break
-                    elif response == "NOJOB":
-                        time.sleep(FETCH_INTERVAL)
-                    else:
-                        time.sleep(FETCH_INTERVAL)
-        except (ConnectionError, OSError):
-            send_to_syslog("connection lost, reconnecting", syslog_port)
-        if not stop_requested:
-            time.sleep(1)
-    
-    send_to_syslog("worker stopped", syslog_port)
-    mcast_sock.close()
+                        fetch_sent = False
+                        response = reader.read_line()
+                        if response is None:
+                            break
+                        if response.startswith("JOB "):
+                            parts = response.split(maxsplit=2)
+                            if len(parts) < 3:
+                                continue
+                            try:
+                                job_id = int(parts[1])
+                            except ValueError:
+                                continue
+                            text = parts[2]
+                            send_to_syslog(syslog_sock, f"fetching job {job_id}", syslog_addr)
+                            if not process_job(mcast_sock, tcp_sock, reader, job_id, text,
+                                               mcast_dest, syslog_sock, syslog_addr):
+                                break
+                            fetch_sent = True
+                        elif response == "NOJOB":
+                            time.sleep(FETCH_INTERVAL)
+                        else:
+                            time.sleep(FETCH_INTERVAL)
+            except (ConnectionError, OSError):
+                send_to_syslog(syslog_sock, "connection lost, reconnecting", syslog_addr)
+            if not stop_requested:
+                time.sleep(1)
+        
+        send_to_syslog(syslog_sock, "worker stopped", syslog_addr)
+    finally:
+        mcast_sock.close()
+        syslog_sock.close()
 
 
 def main(argv: list[str]) -> int: